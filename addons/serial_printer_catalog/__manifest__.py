@@ -6,9 +6,12 @@
     'description': 'Crea productos desde la API de TopTex en el modelo estándar de Odoo',
     'author': 'Serial Printer',
     'license': 'LGPL-3',
-    'depends': ['base', 'product'],
+    'depends': ['base', 'product', 'stock', 'sale'],
     'data': [
-        'data/cron_product.xml'
+        'security/ir.model.access.csv',
+        'data/cron_product.xml',
+        'data/action_bulk_load.xml',
+        'data/cron_image_queue.xml',
     ],
     'installable': True,
     'application': False,
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from odoo import http
+from odoo.exceptions import AccessError, MissingError
+from odoo.http import request
+
+
+class TopTexStockController(http.Controller):
+
+    # -------------------------------------------------
+    # Stock TopTex en tiempo real
+    #   {"skus": [...]}          -> {sku: stock}
+    #   {"sale_order_id": id}    -> {sku: {"requested": x, "available": y}}
+    #   Stock None = TopTex no respondió. Solo usuarios internos.
+    # -------------------------------------------------
+    @http.route('/toptex/stock', type='json', auth='user')
+    def toptex_stock(self, skus=None, sale_order_id=None):
+        if not request.env.user._is_internal():
+            raise AccessError("Solo usuarios internos pueden consultar el stock TopTex.")
+        if sale_order_id:
+            order = request.env['sale.order'].browse(int(sale_order_id)).exists()
+            if not order:
+                raise MissingError("El pedido no existe.")
+            order.check_access('read')
+            checked = order.order_line.toptex_check_stock()
+            products = request.env['product.product'].browse(list(checked))
+            return {
+                p.default_code: {'requested': checked[p.id][0], 'available': checked[p.id][1]}
+                for p in products
+            }
+
+        products = request.env['product.product'].search([('default_code', 'in', skus or [])])
+        stock = products.toptex_live_stock()
+        return {p.default_code: stock.get(p.id) for p in products}
@@ -1 +1,4 @@
-from . import product
\ No newline at end of file
+from . import product
+from . import product_bulk
+from . import stock_live
+from . import image_queue
\ No newline at end of file
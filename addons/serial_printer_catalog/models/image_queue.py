@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+import base64
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+# Tamaños que genera image.mixin (image_1920 … image_128)
+IMAGE_SIZES = (1920, 1024, 512, 256, 128)
+
+
+# -------------------------------------------------
+# Util: imagen original → JPEG en todos los tamaños (base64)
+#   Se ejecuta en hilos del pool: solo PIL, nada de ORM ni cursores.
+# -------------------------------------------------
+def render_image_sizes(image_b64):
+    image = Image.open(io.BytesIO(base64.b64decode(image_b64)))
+    if image.mode in ('RGBA', 'LA'):
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    else:
+        image = image.convert("RGB")
+
+    result = {}
+    for size in IMAGE_SIZES:
+        if image.width > size or image.height > size:
+            image = image.copy()
+            image.thumbnail((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG")
+        result[size] = base64.b64encode(buffer.getvalue())
+    return result
+
+
+class SerialPrinterImageQueue(models.Model):
+    _name = 'serial.printer.image.queue'
+    _description = 'Cola de imágenes TopTex pendientes de redimensionar'
+    _order = 'id'
+
+    res_model = fields.Char(string='Modelo', required=True, index=True)
+    res_id = fields.Integer(string='ID registro', required=True, index=True)
+    image = fields.Binary(string='Imagen original', attachment=False, required=True)
+    state = fields.Selection([
+        ('pending', 'Pendiente'),
+        ('error', 'Error'),
+    ], string='Estado', default='pending', required=True, index=True)
+    error = fields.Text(string='Error')
+
+    # -------------------------------------------------
+    # Encolar: la sync solo guarda la imagen descargada
+    #   entries = [(registro, imagen_base64), ...]
+    # -------------------------------------------------
+    @api.model
+    def enqueue(self, entries):
+        entries = [(record, image) for record, image in entries if record and image]
+        if not entries:
+            return self
+        # Una imagen pendiente por registro: la nueva sustituye a la anterior
+        keys = {(record._name, record.id) for record, _img in entries}
+        old = self.sudo().search([
+            ('res_model', 'in', list({k[0] for k in keys})),
+            ('res_id', 'in', list({k[1] for k in keys})),
+        ]).filtered(lambda q: (q.res_model, q.res_id) in keys)
+        old.unlink()
+        queued = self.sudo().create([
+            {'res_model': record._name, 'res_id': record.id, 'image': image}
+            for record, image in entries
+        ])
+        cron = self.env.ref('serial_printer_catalog.cron_process_image_queue', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+        return queued
+
+    # -------------------------------------------------
+    # Worker: redimensiona en paralelo (hilos) y escribe por tandas
+    #   toptex_image_workers: nº de hilos (por defecto núcleos - 1). Pillow
+    #   suelta el GIL al redimensionar y codificar JPEG, así que los hilos
+    #   sí usan varios núcleos sin arrancar procesos.
+    #   Las originales se leen por tandas de 2 por hilo para no tener el lote
+    #   entero en memoria.
+    # -------------------------------------------------
+    @api.model
+    def process_image_queue(self, batch_size=100):
+        icp = self.env['ir.config_parameter'].sudo()
+        workers = max(1, int(icp.get_param('toptex_image_workers') or (os.cpu_count() or 2) - 1))
+
+        queue = self.sudo().search([('state', '=', 'pending')], limit=batch_size)
+        if not queue:
+            return
+
+        written = errors = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for i in range(0, len(queue), workers * 2):
+                piece = queue[i:i + workers * 2]
+                done, failed = self._process_piece(piece, pool)
+                written += len(done)
+                errors += failed
+        _logger.info(f"🖼️ Cola de imágenes: {written} escritas, {errors} con error")
+
+        cron = self.env.ref('serial_printer_catalog.cron_process_image_queue', raise_if_not_found=False)
+        if cron and len(queue) == batch_size:
+            cron._trigger()
+
+    def _process_piece(self, piece, pool):
+        def _render(src):
+            try:
+                return render_image_sizes(src)
+            except Exception as e:
+                return e
+
+        results = list(pool.map(_render, [q.image for q in piece]))
+
+        done = self.browse()
+        written = []
+        failed = 0
+        for entry, sizes in zip(piece, results):
+            if isinstance(sizes, Exception):
+                entry.write({'state': 'error', 'error': str(sizes)})
+                _logger.warning(f"❌ Imagen no procesable {entry.res_model}({entry.res_id}): {sizes}")
+                failed += 1
+                continue
+            record = self.env[entry.res_model].sudo().browse(entry.res_id).exists()
+            if record:
+                target, prefix = self._write_image_sizes(record, sizes)
+                written.append((entry, target, f'{prefix}_{IMAGE_SIZES[-1]}', sizes[IMAGE_SIZES[-1]]))
+            done |= entry
+
+        # Un flush por tanda para todas sus escrituras
+        self.env.flush_all()
+
+        # Lo guardado en base de datos debe ser lo que generó el pool; si no,
+        # el ORM ha vuelto a redimensionar y se pierde el trabajo del worker
+        for entry, target, field_name, expected in written:
+            target.invalidate_recordset([field_name])
+            if target[field_name] != expected:
+                _logger.warning(f"⚠️ {target._name}({target.id}).{field_name} no coincide con la imagen generada")
+                entry.write({'state': 'error', 'error': f"{field_name} recalculado por el ORM"})
+                done -= entry
+                failed += 1
+        done.unlink()
+        self.env.flush_all()
+        # Suelta de la caché las imágenes ya escritas
+        self.env.invalidate_all()
+        return done, failed
+
+    def _write_image_sizes(self, record, sizes):
+        """Escribe todos los tamaños; devuelve (registro, prefijo de campo).
+
+        Los tamaños menores son campos calculados de image_1920: se protegen
+        para que el flush no los recalcule encima de los del pool.
+        """
+        if record._name == 'product.product':
+            # Misma regla que product.product._set_template_field: la primera
+            # imagen (o la de una variante única) va a la plantilla.
+            tmpl = record.product_tmpl_id
+            if not tmpl.image_1920 or len(tmpl.product_variant_ids) <= 1:
+                if record.image_variant_1920:
+                    record.image_variant_1920 = False
+                record = tmpl
+            else:
+                self._write_protected(record, 'image_variant', sizes)
+                return record, 'image_variant'
+        self._write_protected(record, 'image', sizes)
+        return record, 'image'
+
+    def _write_protected(self, record, prefix, sizes):
+        computed = [record._fields[f'{prefix}_{size}'] for size in IMAGE_SIZES[1:]]
+        with self.env.protecting(computed, record):
+            record.write({f'{prefix}_{size}': sizes[size] for size in IMAGE_SIZES})
@@ -3,41 +3,106 @@ import json
 import logging
 import requests
 import base64
-import io
 import time
 import re
-from PIL import Image
-from odoo import models, api
+import threading
+from odoo import models, fields, api
 from odoo.exceptions import UserError
 
+from .toptex_adaptive import TopTexAdaptiveController
+from .toptex_breaker import CircuitOpenError
+from .toptex_cache import token_cache
+
 _logger = logging.getLogger(__name__)
 
 
 # -------------------------------------------------
-# Util: descargar imagen y devolver base64 (JPEG)
+# Util: descargar imagen y devolver base64 (original, sin recodificar)
+#   La conversión a JPEG y los tamaños se hacen en la cola de imágenes.
 # -------------------------------------------------
 def get_image_binary_from_url(url):
     try:
         _logger.info(f"🖼️ Descargando imagen desde {url}")
-        response = requests.get(url, stream=True, timeout=20)
+        response = requests.get(url, timeout=20)
         if response.status_code == 200 and "image" in response.headers.get("Content-Type", ""):
-            image = Image.open(io.BytesIO(response.content))
-            if image.mode in ('RGBA', 'LA'):
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                background.paste(image, mask=image.split()[-1])
-                image = background
-            else:
-                image = image.convert("RGB")
-            buffer = io.BytesIO()
-            image.save(buffer, format="JPEG")
-            return base64.b64encode(buffer.getvalue())
+            return base64.b64encode(response.content)
         else:
             _logger.warning(f"⚠️ Contenido no válido como imagen: {url}")
     except Exception as e:
-        _logger.warning(f"❌ Error al procesar imagen desde {url}: {str(e)}")
+        _logger.warning(f"❌ Error al descargar imagen desde {url}: {str(e)}")
     return None
 
 
+# -------------------------------------------------
+# Util: page_size alineado con el offset guardado
+#   TopTex pagina por page_number, así que si el controlador cambia el
+#   tamaño de página hay que elegir uno que divida el offset para no
+#   saltarse ni repetir productos.
+# -------------------------------------------------
+def _aligned_page_size(offset, desired, step):
+    if not offset:
+        return desired
+    stride = step if offset % step == 0 else 1
+    size = desired - desired % stride or stride
+    while size > stride and offset % size:
+        size -= stride
+    return size
+
+
+# -------------------------------------------------
+# Util: stock TopTex de un SKU (almacén "toptex")
+#   Devuelve None si el proxy no responde 200. Con reauth, un 401 (token
+#   caducado o revocado) renueva el token y se reintenta una vez.
+# -------------------------------------------------
+def fetch_toptex_stock(ctrl, proxy_url, headers, sku, reauth=None):
+    inv_url = f"{proxy_url}/v3/products/{sku}/inventory"
+    sent = dict(headers)
+    inv_resp = ctrl.request('inventory', 'GET', inv_url, headers=sent)
+    if inv_resp.status_code == 401 and reauth:
+        fresh = reauth(sent)
+        if fresh:
+            inv_resp = ctrl.request('inventory', 'GET', inv_url, headers=fresh)
+    if inv_resp.status_code != 200:
+        _logger.warning(f"❌ Error inventario SKU {sku}: {inv_resp.text}")
+        return None
+
+    try:
+        data_json = inv_resp.json()
+        if isinstance(data_json, dict):
+            warehouses = data_json.get("warehouses", [])
+        elif isinstance(data_json, list) and data_json and isinstance(data_json[0], dict):
+            warehouses = data_json[0].get("warehouses", [])
+        else:
+            warehouses = []
+        stock = 0
+        for wh in warehouses:
+            if isinstance(wh, dict) and wh.get("id") == "toptex":
+                stock = int(wh.get("stock", 0))
+                break
+        _logger.info(f"SKU {sku} Warehouses: {warehouses} | Stock usado: {stock}")
+    except Exception as e:
+        _logger.error(f"❌ JSON error SKU {sku}: {e}")
+        stock = 0
+    return stock
+
+
+# -------------------------------------------------
+# Util: items de /v3/products/{price|inventory} de un catalog_reference
+#   endpoint es a la vez la ruta y la familia del controlador/breaker.
+#   Devuelve None si la respuesta no es válida (se reintenta después);
+#   un 404 es "sin datos" y devuelve [].
+# -------------------------------------------------
+def fetch_toptex_items(ctrl, proxy_url, headers, endpoint, catalog_ref):
+    url = f"{proxy_url}/v3/products/{endpoint}?catalog_reference={catalog_ref}"
+    r = ctrl.request(endpoint, 'GET', url, headers=headers)
+    if r.status_code == 404:
+        return []
+    if r.status_code != 200:
+        _logger.warning(f"❌ Error {endpoint} {catalog_ref}: {r.status_code}")
+        return None
+    return r.json().get("items", [])
+
+
 class ProductTemplate(models.Model):
     _inherit = 'product.template'
 
@@ -56,10 +121,17 @@ class ProductTemplate(models.Model):
         if not all([username, password, api_key, proxy_url]):
             raise UserError("❌ Faltan credenciales o parámetros del sistema.")
 
+        ctrl = TopTexAdaptiveController(icp)
+
         auth_url = f"{proxy_url}/v3/authenticate"
         headers = {"x-api-key": api_key, "Content-Type": "application/json"}
         auth_payload = {"username": username, "password": password}
-        auth_response = requests.post(auth_url, json=auth_payload, headers=headers, timeout=30)
+        try:
+            auth_response = ctrl.request('auth', 'POST', auth_url, json=auth_payload, headers=headers)
+        except (requests.RequestException, CircuitOpenError) as e:
+            _logger.error(f"❌ Proxy TopTex no disponible al autenticar: {e}")
+            ctrl.save()
+            return
         if auth_response.status_code != 200:
             raise UserError(f"❌ Error autenticando: {auth_response.status_code} - {auth_response.text}")
         token = auth_response.json().get("token")
@@ -67,13 +139,27 @@ class ProductTemplate(models.Model):
             raise UserError("❌ No se recibió un token válido.")
         headers["x-toptex-authorization"] = token.strip()
 
-        page_number = int(icp.get_param('toptex_last_page') or 1)
-        page_size = 50
+        # Offset en nº de productos (toptex_last_page se mantiene como origen
+        # para instalaciones que aún no tienen toptex_last_offset, a 50/página)
+        offset = icp.get_param('toptex_last_offset')
+        if offset is False or offset is None:
+            offset = (int(icp.get_param('toptex_last_page') or 1) - 1) * 50
+        offset = int(offset)
+        page_size = _aligned_page_size(offset, ctrl.page_size('catalog'), ctrl.limits['toptex_page_size_step'])
+        page_number = offset // page_size + 1
 
         product_url = f"{proxy_url}/v3/products/all?usage_right=b2b_b2c&page_number={page_number}&page_size={page_size}"
-        resp = requests.get(product_url, headers=headers, timeout=40)
+        try:
+            resp = ctrl.request('catalog', 'GET', product_url, headers=headers)
+        except (requests.RequestException, CircuitOpenError) as e:
+            _logger.warning(f"❌ Página {page_number} no disponible: {e}")
+            ctrl.adjust('catalog', page_size=page_size)
+            ctrl.save()
+            return
+        ctrl.adjust('catalog', page_size=page_size)
         if resp.status_code != 200:
             _logger.warning(f"❌ Error en página {page_number}: {resp.text}")
+            ctrl.save()
             return
 
         batch = resp.json()
@@ -81,7 +167,8 @@ class ProductTemplate(models.Model):
             batch = batch["items"]
         if not batch:
             _logger.info(f"✅ Sin productos nuevos en esta página, fin de proceso.")
-            icp.set_param('toptex_last_page', str(page_number + 1))
+            icp.set_param('toptex_last_offset', str(offset + page_size))
+            ctrl.save()
             return
 
         processed_refs = set(self.env['product.template'].search([]).mapped('default_code'))
@@ -89,6 +176,7 @@ class ProductTemplate(models.Model):
         skip_keys = {'items', 'page_number', 'total_count', 'page_size'}
         any_valid = False
 
+        pending = []
         for data in batch:
             if not isinstance(data, dict) or any(key in data for key in skip_keys):
                 _logger.warning(f"❌ Producto mal formado o ignorado: {data}")
@@ -101,7 +189,26 @@ class ProductTemplate(models.Model):
             if catalog_ref in processed_refs:
                 _logger.info(f"⏩ Producto ya existe: {catalog_ref}")
                 continue
-
+            processed_refs.add(catalog_ref)
+            pending.append((catalog_ref, data))
+
+        # Precios e inventario de toda la página en paralelo (solo HTTP)
+        refs = [ref for ref, _d in pending]
+        prices_by_ref = dict(ctrl.map(
+            'price', lambda ref: fetch_toptex_items(ctrl, proxy_url, headers, 'price', ref), refs))
+        inventory_by_ref = dict(ctrl.map(
+            'inventory', lambda ref: fetch_toptex_items(ctrl, proxy_url, headers, 'inventory', ref), refs))
+
+        # Si un producto se quedó sin precios/inventario (circuito abierto,
+        # timeout o error del proxy) no se crea ahora y el offset no avanza:
+        # la próxima ejecución repite esta página y lo vuelve a intentar.
+        skipped_refs = {ref for ref in refs
+                        if prices_by_ref.get(ref) is None or inventory_by_ref.get(ref) is None}
+        if skipped_refs:
+            _logger.warning(f"⏭️ Productos aplazados sin precios/inventario: {sorted(skipped_refs)}")
+            pending = [(ref, data) for ref, data in pending if ref not in skipped_refs]
+
+        for catalog_ref, data in pending:
             any_valid = True
 
             name_data = data.get("designation", {})
@@ -170,7 +277,6 @@ class ProductTemplate(models.Model):
             try:
                 product_template = self.create(template_vals)
                 _logger.info(f"✅ Producto creado: {catalog_ref} | {full_name}")
-                processed_refs.add(catalog_ref)
                 _logger.info(f"LOTE OFFSET={page_number} CATALOG_REF={catalog_ref}")
             except Exception as e:
                 _logger.error(f"❌ Error creando producto {catalog_ref}: {str(e)}")
@@ -183,16 +289,14 @@ class ProductTemplate(models.Model):
                     if img_url:
                         image_bin = get_image_binary_from_url(img_url)
                         if image_bin:
-                            product_template.image_1920 = image_bin
+                            self.env['serial.printer.image.queue'].enqueue([(product_template, image_bin)])
                             break
             except Exception as e:
                 _logger.warning(f"⚠️ No se pudo asignar imagen a {catalog_ref}: {str(e)}")
 
             # Precios y SKUs de variantes
             try:
-                price_url = f"{proxy_url}/v3/products/price?catalog_reference={catalog_ref}"
-                price_resp = requests.get(price_url, headers=headers, timeout=40)
-                price_data = price_resp.json().get("items", []) if price_resp.status_code == 200 else []
+                price_data = prices_by_ref.get(catalog_ref) or []
 
                 def get_price_cost(color, size):
                     for item in price_data:
@@ -202,9 +306,7 @@ class ProductTemplate(models.Model):
                                 return float(prices[0].get("price", 0.0))
                     return 0.0
 
-                inv_url = f"{proxy_url}/v3/products/inventory?catalog_reference={catalog_ref}"
-                inv_resp = requests.get(inv_url, headers=headers, timeout=40)
-                inventory_items = inv_resp.json().get("items", []) if inv_resp.status_code == 200 else []
+                inventory_items = inventory_by_ref.get(catalog_ref) or []
 
                 def get_sku(color, size):
                     for item in inventory_items:
@@ -229,8 +331,54 @@ class ProductTemplate(models.Model):
 
         if not any_valid:
             _logger.info(f"✅ Lote página={page_number}, sin productos nuevos.")
-        icp.set_param('toptex_last_page', str(page_number + 1))
-        _logger.info(f"OFFSET GUARDADO: {page_number + 1}")
+        if skipped_refs:
+            _logger.info(f"OFFSET SIN AVANZAR: {offset} (productos aplazados)")
+        else:
+            icp.set_param('toptex_last_offset', str(offset + page_size))
+            _logger.info(f"OFFSET GUARDADO: {offset + page_size} (page_size={page_size})")
+        ctrl.save()
+
+    # -------------------------------------------------
+    # Auth: cabeceras con token, o None si el proxy no responde
+    # (timeouts y circuito abierto no rompen el cron)
+    #   token_ttl > 0 reutiliza el token en caché durante esos segundos
+    # -------------------------------------------------
+    def _toptex_auth_headers(self, ctrl, proxy_url, api_key, username, password, token_ttl=0):
+        auth_url = f"{proxy_url}/v3/authenticate"
+        headers = {"x-api-key": api_key, "Content-Type": "application/json"}
+        cache_key = (proxy_url, username)
+        token = token_cache.get(cache_key, token_ttl) if token_ttl else None
+        if token:
+            headers["x-toptex-authorization"] = token
+            return headers
+        try:
+            token = ctrl.request('auth', 'POST', auth_url, json={"username": username, "password": password},
+                                 headers=headers).json().get("token")
+        except (requests.RequestException, CircuitOpenError, ValueError) as e:
+            _logger.error(f"❌ Proxy TopTex no disponible al autenticar: {e}")
+            return None
+        if not token:
+            return None
+        headers["x-toptex-authorization"] = token.strip()
+        token_cache.set(cache_key, token.strip())
+        return headers
+
+    # Renovación del token tras un 401, segura entre hilos: solo el primer
+    # hilo que ve caducado un token pide otro; el resto reutiliza el nuevo.
+    # No toca el ORM, se puede llamar desde ctrl.map().
+    def _toptex_reauth(self, ctrl, proxy_url, api_key, username, password, headers):
+        lock = threading.Lock()
+
+        def _reauth(sent):
+            with lock:
+                if headers.get("x-toptex-authorization") == sent.get("x-toptex-authorization"):
+                    token_cache.invalidate((proxy_url, username))
+                    fresh = self._toptex_auth_headers(ctrl, proxy_url, api_key, username, password)
+                    if not fresh:
+                        return None
+                    headers.update(fresh)
+                return dict(headers)
+        return _reauth
 
     # -------------------------------------------------
     # Stock (bloque PRO que te funcionaba) – WH/Stock
@@ -242,72 +390,73 @@ class ProductTemplate(models.Model):
         username = icp.get_param('toptex_username')
         password = icp.get_param('toptex_password')
 
-        # Auth
-        auth_url = f"{proxy_url}/v3/authenticate"
-        headers = {"x-api-key": api_key, "Content-Type": "application/json"}
-        token = requests.post(auth_url, json={"username": username, "password": password},
-                              headers=headers, timeout=20).json().get("token")
-        if not token:
+        ctrl = TopTexAdaptiveController(icp)
+
+        headers = self._toptex_auth_headers(ctrl, proxy_url, api_key, username, password)
+        if not headers:
             _logger.error("❌ Error autenticando para stock.")
+            ctrl.save()
             return
-        headers["x-toptex-authorization"] = token.strip()
 
         ProductProduct = self.env['product.product']
-        StockQuant = self.env['stock.quant']
 
-        # Usar siempre la ubicación interna principal del almacén
-        warehouse = self.env['stock.warehouse'].search([], limit=1)
-        location = warehouse.lot_stock_id if warehouse else self.env['stock.location'].search([('usage', '=', 'internal')], limit=1)
+        location = self._toptex_stock_location()
         if not location:
             _logger.warning("❌ No hay ubicación interna para crear quants.")
             return
 
         products = ProductProduct.search([("default_code", "!=", False)])
+        eligible = []
         for variant in products:
             if variant.type != 'consu' or not variant.product_tmpl_id.is_storable:
                 _logger.info(f"⏭️ Skip {variant.default_code} (type={variant.type}, is_storable={variant.product_tmpl_id.is_storable})")
                 continue
-
-            sku = variant.default_code
-            inv_url = f"{proxy_url}/v3/products/{sku}/inventory"
-            inv_resp = requests.get(inv_url, headers=headers, timeout=30)
-            if inv_resp.status_code != 200:
-                _logger.warning(f"❌ Error inventario SKU {sku}: {inv_resp.text}")
+            eligible.append(variant)
+
+        # Descarga en paralelo (solo HTTP); la escritura de quants sigue en este hilo
+        reauth = self._toptex_reauth(ctrl, proxy_url, api_key, username, password, headers)
+
+        def _fetch_stock(variant_sku):
+            return fetch_toptex_stock(ctrl, proxy_url, headers, variant_sku[1], reauth=reauth)
+
+        # Primero los SKUs que el circuit breaker saltó en la ejecución anterior
+        retry_skus = set(ctrl.breaker.retry_items('inventory'))
+        items = [(variant, variant.default_code) for variant in eligible]
+        for sku in retry_skus - {sku for _v, sku in items}:
+            ctrl.breaker.resolve('inventory', sku)  # SKU ya no existe
+        items.sort(key=lambda it: it[1] not in retry_skus)
+        for (variant, sku), stock in ctrl.map('inventory', _fetch_stock, items, key=lambda it: it[1]):
+            if stock is None:
                 continue
+            self._toptex_update_quant(variant, location, stock)
 
-            try:
-                data_json = inv_resp.json()
-                if isinstance(data_json, dict):
-                    warehouses = data_json.get("warehouses", [])
-                elif isinstance(data_json, list) and data_json and isinstance(data_json[0], dict):
-                    warehouses = data_json[0].get("warehouses", [])
-                else:
-                    warehouses = []
-                stock = 0
-                for wh in warehouses:
-                    if isinstance(wh, dict) and wh.get("id") == "toptex":
-                        stock = int(wh.get("stock", 0))
-                        break
-                _logger.info(f"SKU {sku} Warehouses: {warehouses} | Stock usado: {stock}")
-            except Exception as e:
-                _logger.error(f"❌ JSON error SKU {sku}: {e}")
-                stock = 0
+        ctrl.save()
 
-            quant = StockQuant.search([
-                ('product_id', '=', variant.id),
-                ('location_id', '=', location.id)
-            ], limit=1)
+    # Usar siempre la ubicación interna principal del almacén
+    def _toptex_stock_location(self):
+        warehouse = self.env['stock.warehouse'].search([], limit=1)
+        return warehouse.lot_stock_id if warehouse else self.env['stock.location'].search([('usage', '=', 'internal')], limit=1)
 
-            if quant:
-                quant.write({'quantity': stock, 'inventory_quantity': stock})
-            else:
-                StockQuant.create({
-                    'product_id': variant.id,
-                    'location_id': location.id,
-                    'quantity': stock,
-                    'inventory_quantity': stock,
-                })
-            _logger.info(f"✅ stock.quant creado/actualizado para {sku} en {location.display_name}: {stock}")
+    def _toptex_update_quant(self, variant, location, stock):
+        StockQuant = self.env['stock.quant']
+        quant = StockQuant.search([
+            ('product_id', '=', variant.id),
+            ('location_id', '=', location.id)
+        ], limit=1)
+
+        # toptex_checked_at hace de caché compartida para toptex_live_stock()
+        if quant:
+            quant.write({'quantity': stock, 'inventory_quantity': stock,
+                         'toptex_checked_at': fields.Datetime.now()})
+        else:
+            StockQuant.create({
+                'product_id': variant.id,
+                'location_id': location.id,
+                'quantity': stock,
+                'inventory_quantity': stock,
+                'toptex_checked_at': fields.Datetime.now(),
+            })
+        _logger.info(f"✅ stock.quant creado/actualizado para {variant.default_code} en {location.display_name}: {stock}")
 
     # -------------------------------------------------
     # Imágenes por variante (resumible + timeout)
@@ -322,17 +471,13 @@ class ProductTemplate(models.Model):
         username = icp.get_param('toptex_username')
         password = icp.get_param('toptex_password')
 
-        # Auth
-        auth_url = f"{proxy}/v3/authenticate"
-        headers = {"x-api-key": api_key, "Content-Type": "application/json"}
-        token = requests.post(
-            auth_url, json={"username": username, "password": password},
-            headers=headers, timeout=20
-        ).json().get("token")
-        if not token:
+        ctrl = TopTexAdaptiveController(icp)
+
+        headers = self._toptex_auth_headers(ctrl, proxy, api_key, username, password)
+        if not headers:
             _logger.error("❌ Error autenticando para imágenes.")
+            ctrl.save()
             return
-        headers["x-toptex-authorization"] = token.strip()
 
         # Reanudar desde último id procesado
         last_id = int(icp.get_param("toptex_img_last_id") or 0)
@@ -341,8 +486,78 @@ class ProductTemplate(models.Model):
         def _norm(s):
             return re.sub(r"\s+", "", (s or "")).strip().lower()
 
-        start = time.monotonic()
-        processed_any = False
+        def _lookup(query):
+            """Primer producto devuelto por /v3/products?<query>, o None."""
+            r = ctrl.request('images', 'GET', f"{proxy}/v3/products?{query}&usage_right=b2b_b2c", headers=headers)
+            if r.status_code != 200:
+                return None
+            try:
+                j = r.json()
+            except Exception:
+                return None
+            if isinstance(j, dict) and j.get("items"):
+                return j["items"][0]
+            if isinstance(j, list) and j:
+                return j[0]
+            if isinstance(j, dict):
+                return j
+            return None
+
+        def _image_url(data, color_name):
+            # imagen directa
+            imgs = (data.get("images") or [])
+            if imgs:
+                img_url = (imgs[0] or {}).get("url_image")
+                if img_url:
+                    return img_url
+            if not color_name:
+                return None
+            # fallback por color (packshot FACE o primera imagen)
+            color_imgs = {}
+            for c in (data.get("colors") or []):
+                name_es = ((c.get("colors") or {}).get("es")) or ""
+                name_en = ((c.get("colors") or {}).get("en")) or ""
+                face = (((c.get("packshots") or {}).get("FACE") or {}).get("url_packshot")) or ""
+                if not face:
+                    imgs_c = (c.get("images") or [])
+                    if imgs_c:
+                        face = (imgs_c[0] or {}).get("url_image") or ""
+                if face:
+                    color_imgs[_norm(name_es)] = face
+                    color_imgs[_norm(name_en)] = face
+            return color_imgs.get(color_name)
+
+        # Se ejecuta en hilos: solo HTTP y PIL, nada de ORM
+        def _resolve(job):
+            _vid, sku, cref, color_name = job
+            img_url = None
+
+            # (A) Buscar por SKU
+            try:
+                data = _lookup(f"sku={sku}")
+                if data:
+                    img_url = _image_url(data, color_name)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                _logger.warning(f"⚠️ Error SKU {sku}: {e}")
+
+            # (B) Fallback por catalog_reference
+            if not img_url:
+                try:
+                    data = _lookup(f"catalog_reference={cref}")
+                    if data:
+                        img_url = _image_url(data, color_name)
+                except CircuitOpenError:
+                    raise
+                except Exception as e:
+                    _logger.warning(f"⚠️ Fallback catalog {cref} ({sku}): {e}")
+
+            if not img_url:
+                return None, None
+            return img_url, get_image_binary_from_url(img_url)
+
+        deadline = time.monotonic() + max_seconds
 
         ids = Product.search(
             [('default_code', '!=', False), ('id', '>', last_id)],
@@ -355,115 +570,48 @@ class ProductTemplate(models.Model):
                 order='id', limit=batch_size
             ).ids
 
-        for vid in ids:
-            if time.monotonic() - start > max_seconds:
-                _logger.info("⏹️ Tiempo límite alcanzado, guardando offset y saliendo…")
-                break
-
-            variant = Product.browse(vid)
-            sku = variant.default_code
-            tmpl = variant.product_tmpl_id
+        # Primero las variantes que el circuit breaker saltó la vez anterior
+        # (no mueven el offset: pueden ser anteriores a last_id)
+        offset_ids = set(ids)
+        pending_retry = ctrl.breaker.retry_items('images')
+        retry_ids = Product.browse(pending_retry).exists().filtered('default_code').ids
+        retry_set = set(retry_ids)
+        for vid in set(pending_retry) - retry_set:
+            ctrl.breaker.resolve('images', vid)  # variante borrada o sin SKU
+        ids = retry_ids + [i for i in ids if i not in retry_set]
+
+        jobs = []
+        labels = {}
+        for variant in Product.browse(ids):
             color_val = variant.product_template_attribute_value_ids.filtered(
                 lambda v: v.attribute_id.name.lower() == "color"
             )
-            color_name = _norm(color_val.name if color_val else "")
-            img_url = None
-
-            # (A) Buscar por SKU
-            try:
-                url = f"{proxy}/v3/products?sku={sku}&usage_right=b2b_b2c"
-                r = requests.get(url, headers=headers, timeout=20)
-                data = None
-                if r.status_code == 200:
-                    try:
-                        j = r.json()
-                        if isinstance(j, dict) and j.get("items"):
-                            data = j["items"][0]
-                        elif isinstance(j, list) and j:
-                            data = j[0]
-                        elif isinstance(j, dict):
-                            data = j
-                    except Exception:
-                        data = None
-
-                if data:
-                    # imagen directa
-                    imgs = (data.get("images") or [])
-                    if imgs:
-                        img_url = (imgs[0] or {}).get("url_image")
-
-                    # fallback por color
-                    if not img_url:
-                        color_imgs = {}
-                        for c in (data.get("colors") or []):
-                            name_es = ((c.get("colors") or {}).get("es")) or ""
-                            name_en = ((c.get("colors") or {}).get("en")) or ""
-                            face = (((c.get("packshots") or {}).get("FACE") or {}).get("url_packshot")) or ""
-                            if not face:
-                                imgs_c = (c.get("images") or [])
-                                if imgs_c:
-                                    face = (imgs_c[0] or {}).get("url_image") or ""
-                            if face:
-                                color_imgs[_norm(name_es)] = face
-                                color_imgs[_norm(name_en)] = face
-                        if color_name:
-                            img_url = color_imgs.get(color_name)
-            except Exception as e:
-                _logger.warning(f"⚠️ Error SKU {sku}: {e}")
-
-            # (B) Fallback por catalog_reference
-            if not img_url:
-                try:
-                    cref = tmpl.default_code or ""
-                    url = f"{proxy}/v3/products?catalog_reference={cref}&usage_right=b2b_b2c"
-                    r = requests.get(url, headers=headers, timeout=20)
-                    data = None
-                    if r.status_code == 200:
-                        try:
-                            j = r.json()
-                            if isinstance(j, dict) and j.get("items"):
-                                data = j["items"][0]
-                            elif isinstance(j, list) and j:
-                                data = j[0]
-                            elif isinstance(j, dict):
-                                data = j
-                        except Exception:
-                            data = None
-
-                    if data:
-                        imgs = (data.get("images") or [])
-                        if imgs:
-                            img_url = (imgs[0] or {}).get("url_image")
-
-                        if not img_url and color_name:
-                            color_imgs = {}
-                            for c in (data.get("colors") or []):
-                                name_es = ((c.get("colors") or {}).get("es")) or ""
-                                name_en = ((c.get("colors") or {}).get("en")) or ""
-                                face = (((c.get("packshots") or {}).get("FACE") or {}).get("url_packshot")) or ""
-                                if not face:
-                                    imgs_c = (c.get("images") or [])
-                                    if imgs_c:
-                                        face = (imgs_c[0] or {}).get("url_image") or ""
-                                if face:
-                                    color_imgs[_norm(name_es)] = face
-                                    color_imgs[_norm(name_en)] = face
-                            img_url = color_imgs.get(color_name)
-                except Exception as e:
-                    _logger.warning(f"⚠️ Fallback catalog {tmpl.default_code} ({sku}): {e}")
-
+            labels[variant.id] = color_val.name if color_val else '-'
+            jobs.append((variant.id, variant.default_code, variant.product_tmpl_id.default_code or "",
+                         _norm(color_val.name if color_val else "")))
+
+        # Solo se encola la imagen descargada; el redimensionado lo hace
+        # serial.printer.image.queue fuera de este bucle
+        to_queue = []
+        for (vid, sku, _cref, _color), result in ctrl.map('images', _resolve, jobs, deadline=deadline,
+                                                          key=lambda job: job[0]):
+            img_url, b = result or (None, None)
             if img_url:
-                b = get_image_binary_from_url(img_url)
                 if b:
-                    variant.image_1920 = b
-                    _logger.info(f"🖼️ Imagen asignada a variante {sku}")
+                    to_queue.append((Product.browse(vid), b))
+                    _logger.info(f"🖼️ Imagen encolada para variante {sku}")
                 else:
                     _logger.warning(f"❌ Descarga fallida para {sku}: {img_url}")
             else:
-                _logger.warning(f"❌ Sin packshot para SKU/color: {sku} ({color_val.name if color_val else '-'})")
+                _logger.warning(f"❌ Sin packshot para SKU/color: {sku} ({labels[vid]})")
+
+            if vid in offset_ids:
+                last_id = vid  # avanzar offset
 
-            processed_any = True
-            last_id = vid  # avanzar offset
+        self.env['serial.printer.image.queue'].enqueue(to_queue)
 
-        icp.set_param("toptex_img_last_id", str(last_id if processed_any else 0))
-        _logger.info(f"🧭 IMG offset guardado: {last_id if processed_any else 0}")
\ No newline at end of file
+        if time.monotonic() > deadline:
+            _logger.info("⏹️ Tiempo límite alcanzado, guardando offset y saliendo…")
+        icp.set_param("toptex_img_last_id", str(last_id))
+        _logger.info(f"🧭 IMG offset guardado: {last_id}")
+        ctrl.save()
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+import itertools
+import logging
+import time
+
+import requests
+from psycopg2.extras import execute_values
+
+from odoo import models, api
+from odoo.exceptions import UserError
+
+from .product import fetch_toptex_items
+from .toptex_adaptive import TopTexAdaptiveController
+from .toptex_breaker import CircuitOpenError
+
+_logger = logging.getLogger(__name__)
+
+MAGIC_COLUMNS = ('create_uid', 'create_date', 'write_uid', 'write_date')
+
+
+# -------------------------------------------------
+# Util: INSERT multi-fila ... RETURNING id
+#   Completa defaults del modelo y columnas mágicas igual que create(),
+#   pero sin pasar por create() (ni onchanges, ni _create_variant_ids).
+# -------------------------------------------------
+def _bulk_insert(Model, rows, page_size=1000):
+    if not rows:
+        return []
+    env = Model.env
+    explicit = sorted({fname for row in rows for fname in row})
+    default_fields = [
+        fname for fname, field in Model._fields.items()
+        if field.store and field.column_type and not field.compute and not field.company_dependent
+        and fname not in explicit and fname not in MAGIC_COLUMNS and fname != 'id'
+    ]
+    defaults = Model.default_get(default_fields)
+    now = env.cr.now()
+    magic = {'create_uid': env.uid, 'create_date': now, 'write_uid': env.uid, 'write_date': now}
+
+    columns = explicit + [f for f in defaults if f not in explicit] + list(MAGIC_COLUMNS)
+    fields_ = [Model._fields[c] for c in columns]
+    values = []
+    for row in rows:
+        vals = dict(defaults, **magic, **row)
+        values.append(tuple(f.convert_to_column_insert(vals.get(f.name), Model, vals) for f in fields_))
+
+    query = 'INSERT INTO "%s" (%s) VALUES %%s RETURNING id' % (
+        Model._table, ", ".join(f'"{c}"' for c in columns),
+    )
+    return [r[0] for r in execute_values(env.cr._obj, query, values, page_size=page_size, fetch=True)]
+
+
+def _bulk_insert_m2m(Model, fname, pairs, page_size=5000):
+    if not pairs:
+        return
+    field = Model._fields[fname]
+    query = 'INSERT INTO "%s" ("%s", "%s") VALUES %%s ON CONFLICT DO NOTHING' % (
+        field.relation, field.column1, field.column2,
+    )
+    execute_values(Model.env.cr._obj, query, pairs, page_size=page_size)
+
+
+def _bulk_recompute(records, exclude=()):
+    """Marca los campos computados almacenados para recalcular (menos los ya escritos)."""
+    for field in records._fields.values():
+        if field.store and field.compute and field.name not in exclude:
+            records.env.add_to_compute(field, records)
+
+
+class ProductTemplate(models.Model):
+    _inherit = 'product.template'
+
+    # -------------------------------------------------
+    # Carga masiva inicial del catálogo
+    #   La acción de servidor "Carga masiva catálogo TopTex" no la ejecuta
+    #   en la petición HTTP (superaría limit_time_real): marca
+    #   toptex_bulk_load_requested y lanza el cron cron_bulk_load_catalog.
+    #   Desde el cron se hace commit tras cada bloque: si el worker muere por
+    #   limit_time_real_cron (por defecto = limit_time_real, 120 s) lo ya
+    #   cargado se queda y la siguiente ejecución sigue donde se quedó (los
+    #   productos existentes se saltan). Para una carga completa conviene
+    #   subir limit_time_real_cron en odoo.conf (p. ej. 3600).
+    #   toptex_bulk_load_progress guarda el avance ("cargados/total").
+    #   También desde shell:
+    #     odoo-bin shell -d <db>
+    #     >>> env['product.template'].bulk_load_catalog_from_api(commit=True)
+    # -------------------------------------------------
+    @api.model
+    def action_bulk_load_catalog(self):
+        self.env['ir.config_parameter'].sudo().set_param('toptex_bulk_load_requested', '1')
+        self.env.ref('serial_printer_catalog.cron_bulk_load_catalog')._trigger()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': "Carga masiva TopTex",
+                'message': "La carga se ejecutará en segundo plano (cron).",
+                'type': 'info',
+            },
+        }
+
+    @api.model
+    def _cron_bulk_load_catalog(self):
+        # La marca solo se quita al terminar: si la carga se corta, el cron
+        # la retoma en su siguiente ejecución
+        icp = self.env['ir.config_parameter'].sudo()
+        if not icp.get_param('toptex_bulk_load_requested'):
+            return
+        self.bulk_load_catalog_from_api(commit=True)
+        icp.set_param('toptex_bulk_load_requested', False)
+
+    @api.model
+    def bulk_load_catalog_from_api(self, chunk_size=500, max_pages=None, commit=False):
+        icp = self.env['ir.config_parameter'].sudo()
+        username = icp.get_param('toptex_username')
+        password = icp.get_param('toptex_password')
+        api_key = icp.get_param('toptex_api_key')
+        proxy_url = icp.get_param('toptex_proxy_url')
+
+        if not all([username, password, api_key, proxy_url]):
+            raise UserError("❌ Faltan credenciales o parámetros del sistema.")
+
+        ctrl = TopTexAdaptiveController(icp)
+        headers = self._toptex_auth_headers(ctrl, proxy_url, api_key, username, password)
+        if not headers:
+            ctrl.save()
+            raise UserError("❌ Error autenticando con TopTex.")
+
+        start = time.monotonic()
+
+        # 1) Catálogo completo (page_size fijo durante toda la carga)
+        page_size = ctrl.page_size('catalog')
+        catalog = []
+        for page_number in itertools.count(1):
+            if max_pages and page_number > max_pages:
+                break
+            url = f"{proxy_url}/v3/products/all?usage_right=b2b_b2c&page_number={page_number}&page_size={page_size}"
+            try:
+                resp = ctrl.request('catalog', 'GET', url, headers=headers)
+            except (requests.RequestException, CircuitOpenError) as e:
+                ctrl.adjust('catalog', page_size=page_size)
+                ctrl.save()
+                raise UserError(f"❌ Página {page_number} no disponible: {e}")
+            ctrl.adjust('catalog', page_size=page_size)
+            if resp.status_code != 200:
+                ctrl.save()
+                raise UserError(f"❌ Error en página {page_number}: {resp.status_code} - {resp.text}")
+            batch = resp.json()
+            if isinstance(batch, dict) and "items" in batch:
+                batch = batch["items"]
+            if not batch:
+                break
+            catalog.extend(batch)
+            _logger.info(f"📦 Página {page_number}: {len(batch)} productos (total {len(catalog)})")
+        loaded_offset = len(catalog)
+
+        existing = set(self.with_context(active_test=False).search([]).mapped('default_code'))
+        products = {}
+        for data in catalog:
+            catalog_ref = isinstance(data, dict) and data.get("catalogReference")
+            if not catalog_ref or catalog_ref in existing or catalog_ref in products:
+                continue
+            parsed = self._bulk_parse_product(data)
+            if not parsed['colors'] or not parsed['sizes']:
+                _logger.warning(f"❌ Producto sin colores/tallas, ignorado: {catalog_ref}")
+                continue
+            products[catalog_ref] = parsed
+        _logger.info(f"🧮 {len(products)} productos nuevos de {len(catalog)} en el catálogo")
+
+        # 2) Atributos y valores
+        Attribute = self.env['product.attribute']
+        color_attr = Attribute.search([('name', '=', 'Color')], limit=1) or Attribute.create({'name': 'Color'})
+        size_attr = Attribute.search([('name', '=', 'Talla')], limit=1) or Attribute.create({'name': 'Talla'})
+        self.env.flush_all()
+
+        value_ids = {
+            color_attr.id: self._bulk_attribute_values(color_attr, {c for p in products.values() for c in p['colors']}),
+            size_attr.id: self._bulk_attribute_values(size_attr, {s for p in products.values() for s in p['sizes']}),
+        }
+
+        if commit:
+            self.env.cr.commit()
+
+        # 3) Por bloques: precios e inventario en paralelo, inserción y commit
+        all_refs = list(products)
+        skipped = []
+        loaded = total_variants = 0
+        for chunk in (all_refs[i:i + chunk_size] for i in range(0, len(all_refs), chunk_size)):
+            prices_by_ref = dict(ctrl.map(
+                'price', lambda ref: fetch_toptex_items(ctrl, proxy_url, headers, 'price', ref), chunk))
+            inventory_by_ref = dict(ctrl.map(
+                'inventory', lambda ref: fetch_toptex_items(ctrl, proxy_url, headers, 'inventory', ref), chunk))
+            # Circuito abierto, timeout o error: el producto queda para la próxima carga
+            failed = [ref for ref in chunk if prices_by_ref.get(ref) is None or inventory_by_ref.get(ref) is None]
+            if failed:
+                _logger.warning(f"⏭️ {len(failed)} productos sin precios/inventario, quedan pendientes: {failed}")
+                skipped.extend(failed)
+                failed_set = set(failed)
+                chunk = [ref for ref in chunk if ref not in failed_set]
+            if chunk:
+                total_variants += self._bulk_insert_chunk(
+                    {ref: products[ref] for ref in chunk}, prices_by_ref, inventory_by_ref,
+                    color_attr, size_attr, value_ids,
+                )
+                loaded += len(chunk)
+            icp.set_param('toptex_bulk_load_progress', f"{loaded}/{len(all_refs)}")
+            if commit:
+                self.env.cr.commit()
+
+        self.env.registry.clear_cache()
+        if not skipped:
+            icp.set_param('toptex_last_offset', str(loaded_offset))
+        ctrl.save()
+        _logger.info(
+            f"✅ Carga masiva: {loaded} productos, {total_variants} variantes "
+            f"en {time.monotonic() - start:.0f}s"
+        )
+        return loaded
+
+    @api.model
+    def _bulk_parse_product(self, data):
+        # Mismas reglas que sync_product_from_api
+        name_data = data.get("designation", {})
+        name = name_data.get("es") or name_data.get("en") or "Producto sin nombre"
+        name = name.replace("TopTex", "").strip()
+        colors, sizes = [], []
+        for color in data.get("colors", []):
+            c_name = color.get("colors", {}).get("es", "") or color.get("colors", {}).get("en", "")
+            if not c_name:
+                continue
+            if c_name not in colors:
+                colors.append(c_name)
+            for size in color.get("sizes", []):
+                s_name = size.get("size")
+                if s_name and s_name not in sizes:
+                    sizes.append(s_name)
+        return {
+            'name': f"{data.get('catalogReference')} {name}".strip(),
+            'description': data.get("description", {}).get("es", "") or data.get("description", {}).get("en", ""),
+            'colors': colors,
+            'sizes': sizes,
+        }
+
+    @api.model
+    def _bulk_attribute_values(self, attribute, names):
+        """{nombre: id} de los valores del atributo, insertando los que falten."""
+        Value = self.env['product.attribute.value']
+        found = {v['name']: v['id'] for v in Value.search_read([('attribute_id', '=', attribute.id)], ['name'])}
+        missing = sorted(n for n in names if n not in found)
+        new_ids = _bulk_insert(Value, [{'name': n, 'attribute_id': attribute.id} for n in missing])
+        found.update(zip(missing, new_ids))
+        if new_ids:
+            _logger.info(f"🏷️ {len(new_ids)} valores nuevos para {attribute.name}")
+        return found
+
+    @api.model
+    def _bulk_insert_chunk(self, products, prices_by_ref, inventory_by_ref, color_attr, size_attr, value_ids):
+        Line = self.env['product.template.attribute.line']
+        PTAV = self.env['product.template.attribute.value']
+        Product = self.env['product.product']
+        categ_id = self.env.ref("product.product_category_all").id
+
+        # SKU y coste por (color, talla): primer elemento que coincide, como en el cron
+        variant_data = {}
+        for ref, parsed in products.items():
+            skus, costs = {}, {}
+            for item in inventory_by_ref.get(ref) or []:
+                skus.setdefault((item.get("color"), item.get("size")), item.get("sku"))
+            for item in prices_by_ref.get(ref) or []:
+                prices = item.get("prices", [])
+                if prices:
+                    costs.setdefault((item.get("color"), item.get("size")), float(prices[0].get("price", 0.0)))
+            combos = [(c, s, skus.get((c, s)) or None, costs.get((c, s), 0.0))
+                      for c, s in itertools.product(parsed['colors'], parsed['sizes'])]
+            variant_data[ref] = combos
+
+        # Plantillas (el lst_price de la última variante acaba en list_price, igual que en el cron)
+        refs = list(products)
+        tmpl_rows = []
+        for ref in refs:
+            last_cost = variant_data[ref][-1][3]
+            tmpl_rows.append({
+                'name': products[ref]['name'],
+                'default_code': ref,
+                'type': 'consu',
+                'is_storable': True,
+                'description_sale': products[ref]['description'],
+                'categ_id': categ_id,
+                'list_price': round(last_cost * 2, 2) if last_cost else 9.99,
+            })
+        tmpl_ids = dict(zip(refs, _bulk_insert(self, tmpl_rows)))
+
+        # Líneas de atributo + valores (m2m)
+        line_keys, line_rows, line_values = [], [], []
+        for ref in refs:
+            for attr, names in ((color_attr, products[ref]['colors']), (size_attr, products[ref]['sizes'])):
+                line_keys.append((ref, attr.id))
+                line_rows.append({'product_tmpl_id': tmpl_ids[ref], 'attribute_id': attr.id, 'active': True})
+                line_values.append([value_ids[attr.id][n] for n in names])
+        line_ids = _bulk_insert(Line, line_rows)
+        _bulk_insert_m2m(Line, 'value_ids', [
+            (line_id, value_id) for line_id, vals in zip(line_ids, line_values) for value_id in vals
+        ])
+
+        # Valores de atributo por plantilla (PTAV)
+        ptav_keys, ptav_rows = [], []
+        for (ref, attr_id), line_id, vals in zip(line_keys, line_ids, line_values):
+            for value_id in vals:
+                ptav_keys.append((ref, attr_id, value_id))
+                ptav_rows.append({
+                    'product_attribute_value_id': value_id,
+                    'attribute_line_id': line_id,
+                    'product_tmpl_id': tmpl_ids[ref],
+                    'attribute_id': attr_id,
+                    'ptav_active': True,
+                })
+        ptav_ids = dict(zip(ptav_keys, _bulk_insert(PTAV, ptav_rows)))
+
+        # Variantes + combinación
+        variant_rows, combinations, costs = [], [], []
+        for ref in refs:
+            for color, size, sku, cost in variant_data[ref]:
+                variant_rows.append({'product_tmpl_id': tmpl_ids[ref], 'default_code': sku, 'active': True})
+                combinations.append((
+                    ptav_ids[(ref, color_attr.id, value_ids[color_attr.id][color])],
+                    ptav_ids[(ref, size_attr.id, value_ids[size_attr.id][size])],
+                ))
+                costs.append(cost)
+        variant_ids = _bulk_insert(Product, variant_rows)
+        _bulk_insert_m2m(Product, 'product_template_attribute_value_ids', [
+            (variant_id, ptav_id) for variant_id, combo in zip(variant_ids, combinations) for ptav_id in combo
+        ])
+
+        # Recalcular computados almacenados e invalidar caché, como tras create()
+        self.env.invalidate_all()
+        _bulk_recompute(self.browse(list(tmpl_ids.values())), exclude=tmpl_rows[0])
+        _bulk_recompute(Line.browse(line_ids), exclude=line_rows[0])
+        _bulk_recompute(PTAV.browse(list(ptav_ids.values())), exclude=ptav_rows[0])
+        _bulk_recompute(Product.browse(variant_ids), exclude=variant_rows[0])
+        self.env.flush_all()
+
+        # standard_price es company_dependent: por ORM, agrupado por coste
+        by_cost = {}
+        for variant_id, cost in zip(variant_ids, costs):
+            by_cost.setdefault(cost, []).append(variant_id)
+        for cost, ids in by_cost.items():
+            Product.browse(ids).write({'standard_price': cost})
+        self.env.flush_all()
+        self.env.invalidate_all()
+
+        _logger.info(f"🧵 Bloque cargado: {len(refs)} productos, {len(variant_ids)} variantes")
+        return len(variant_ids)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import logging
+from datetime import timedelta
+
+from odoo import models, fields
+from odoo.exceptions import UserError
+
+from .product import fetch_toptex_stock
+from .toptex_adaptive import TopTexAdaptiveController
+
+_logger = logging.getLogger(__name__)
+
+
+class StockQuant(models.Model):
+    _inherit = 'stock.quant'
+
+    # Última lectura del stock TopTex: hace de caché común a todos los workers
+    toptex_checked_at = fields.Datetime(string='Stock TopTex consultado', readonly=True)
+
+
+class ProductProduct(models.Model):
+    _inherit = 'product.product'
+
+    # -------------------------------------------------
+    # Stock TopTex en tiempo real (caché TTL compartida)
+    #   - toptex_stock_cache_ttl: segundos de validez (300 por defecto)
+    #   - La caché es el quant de la ubicación TopTex (toptex_checked_at),
+    #     común a todos los workers; el cron de stock también la refresca
+    #   - Solo consulta los SKUs caducados, en paralelo
+    # -------------------------------------------------
+    def toptex_live_stock(self):
+        icp = self.env['ir.config_parameter'].sudo()
+        ttl = float(icp.get_param('toptex_stock_cache_ttl') or 300)
+        Template = self.env['product.template'].sudo()
+        location = Template._toptex_stock_location()
+        variants = self.filtered('default_code')
+
+        result = {}
+        if location:
+            fresh = self.env['stock.quant'].sudo().search([
+                ('product_id', 'in', variants.ids),
+                ('location_id', '=', location.id),
+                ('toptex_checked_at', '>=', fields.Datetime.now() - timedelta(seconds=ttl)),
+            ])
+            for quant in fresh:
+                result[quant.product_id.id] = int(quant.quantity)
+        missing = [(variant, variant.default_code) for variant in variants if variant.id not in result]
+        if not missing:
+            return result
+
+        proxy_url = icp.get_param('toptex_proxy_url')
+        api_key = icp.get_param('toptex_api_key')
+        username = icp.get_param('toptex_username')
+        password = icp.get_param('toptex_password')
+
+        # Sin ctrl.save(): esto corre en peticiones HTTP concurrentes y no debe
+        # competir por ir.config_parameter; breaker y límites se leen del cron.
+        ctrl = TopTexAdaptiveController(icp)
+        headers = Template._toptex_auth_headers(
+            ctrl, proxy_url, api_key, username, password,
+            token_ttl=float(icp.get_param('toptex_token_cache_ttl') or 600),
+        )
+        if not headers:
+            _logger.warning(f"⚠️ Stock en tiempo real no disponible para {len(missing)} SKUs")
+            return result
+        # El token cacheado puede haber caducado o revocarse en TopTex
+        reauth = Template._toptex_reauth(ctrl, proxy_url, api_key, username, password, headers)
+
+        def _fetch(item):
+            return fetch_toptex_stock(ctrl, proxy_url, headers, item[1], reauth=reauth)
+
+        workers = min(len(missing), ctrl.limits['toptex_workers_max'])
+        for (variant, sku), stock in ctrl.map('inventory', _fetch, missing, workers=workers):
+            if stock is None:
+                continue
+            result[variant.id] = stock
+            if location and variant.is_storable:
+                Template._toptex_update_quant(variant.sudo(), location, stock)
+        return result
+
+
+class SaleOrderLine(models.Model):
+    _inherit = 'sale.order.line'
+
+    def toptex_check_stock(self):
+        """{product_id: (cantidad pedida, stock TopTex)} de las líneas con SKU.
+
+        El stock es None si TopTex no respondió para ese producto.
+        """
+        lines = self.filtered(lambda l: l.product_id.default_code)
+        available = lines.mapped('product_id').toptex_live_stock()
+        requested = {}
+        for line in lines:
+            qty = line.product_uom._compute_quantity(line.product_uom_qty, line.product_id.uom_id)
+            requested[line.product_id.id] = requested.get(line.product_id.id, 0.0) + qty
+        return {pid: (qty, available.get(pid)) for pid, qty in requested.items()}
+
+
+class SaleOrder(models.Model):
+    _inherit = 'sale.order'
+
+    def action_confirm(self):
+        # Activable con toptex_check_stock_on_confirm = 1. Si TopTex no
+        # responde no se confirma: sin stock verificado se bloquea el pedido.
+        if self.env['ir.config_parameter'].sudo().get_param('toptex_check_stock_on_confirm'):
+            short = []
+            unverified = []
+            for order in self:
+                for pid, (qty, stock) in order.order_line.toptex_check_stock().items():
+                    product = self.env['product.product'].browse(pid)
+                    if stock is None:
+                        unverified.append(f"{order.name}: {product.display_name}")
+                    elif qty > stock:
+                        short.append(f"{order.name}: {product.display_name} ({qty:g} pedidas, {stock} en TopTex)")
+            errors = []
+            if short:
+                errors.append("❌ Sin stock suficiente en TopTex:\n" + "\n".join(short))
+            if unverified:
+                errors.append("❌ No se pudo comprobar el stock en TopTex:\n" + "\n".join(unverified))
+            if errors:
+                raise UserError("\n\n".join(errors))
+        return super().action_confirm()
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .toptex_breaker import CircuitOpenError, TopTexCircuitBreaker
+from .toptex_params import load_json_param, save_json_params
+
+_logger = logging.getLogger(__name__)
+
+# Una clave por endpoint (toptex_adaptive_state.catalog, …) para que crons
+# solapados no se pisen lo aprendido
+STATE_PARAM = 'toptex_adaptive_state'
+
+_SKIPPED = object()
+_LATE = object()
+
+# Límites (sobrescribibles desde ir.config_parameter con la misma clave)
+LIMIT_DEFAULTS = {
+    'toptex_page_size_min': 10,
+    'toptex_page_size_max': 200,
+    'toptex_page_size_step': 10,
+    'toptex_workers_min': 1,
+    'toptex_workers_max': 8,
+    'toptex_latency_target': 5.0,      # segundos por llamada
+    'toptex_error_rate_max': 0.05,     # 5% de errores/timeouts
+    'toptex_payload_max_kb': 4096,     # tamaño máximo de respuesta deseado
+    'toptex_timeout_min': 5,
+}
+
+# Valores de arranque = los que estaban fijos en el código
+# (page_size 0 = endpoint sin paginación; solo catalog pagina)
+INITIAL_STATE = {
+    'auth': {'page_size': 0, 'workers': 1, 'timeout': 30},
+    'catalog': {'page_size': 50, 'workers': 1, 'timeout': 40},
+    'price': {'page_size': 0, 'workers': 1, 'timeout': 40},
+    'inventory': {'page_size': 0, 'workers': 1, 'timeout': 30},
+    'images': {'page_size': 0, 'workers': 1, 'timeout': 20},
+}
+
+
+class TopTexAdaptiveController:
+    """Controlador AIMD por endpoint de TopTex.
+
+    Mide latencia, ratio de errores y tamaño de respuesta de cada familia de
+    endpoints y ajusta page_size / nº de workers dentro de los límites
+    configurados: suma +step / +1 worker mientras el proxy responde bien y
+    divide entre 2 cuando empieza a sufrir. Lo aprendido se guarda en
+    ir.config_parameter (toptex_adaptive_state.<endpoint>) para la siguiente
+    ejecución; solo se escriben los endpoints usados en esta ejecución.
+    """
+
+    def __init__(self, icp):
+        self.icp = icp
+        self.limits = {}
+        for key, default in LIMIT_DEFAULTS.items():
+            try:
+                self.limits[key] = type(default)(icp.get_param(key) or default)
+            except (TypeError, ValueError):
+                self.limits[key] = default
+
+        self.state = {}
+        for endpoint, initial in INITIAL_STATE.items():
+            saved = load_json_param(icp, f'{STATE_PARAM}.{endpoint}')
+            self.state[endpoint] = dict(initial, **saved)
+            if endpoint != 'catalog':
+                self.state[endpoint]['page_size'] = 0
+
+        self._lock = threading.Lock()
+        self._window = {}
+        self._touched = set()
+        self.breaker = TopTexCircuitBreaker(icp)
+
+    # ---------------- lectura ----------------
+    def _endpoint(self, endpoint):
+        return self.state.setdefault(endpoint, {'page_size': 0, 'workers': 1, 'timeout': 30})
+
+    def page_size(self, endpoint):
+        return int(self._endpoint(endpoint)['page_size'])
+
+    def workers(self, endpoint):
+        return int(self._endpoint(endpoint)['workers'])
+
+    def timeout(self, endpoint):
+        """Timeout = 4x la latencia media observada, sin pasar del configurado."""
+        st = self._endpoint(endpoint)
+        ceiling = st.get('timeout') or 30
+        latency = st.get('latency')
+        if not latency:
+            return ceiling
+        return max(self.limits['toptex_timeout_min'], min(ceiling, round(latency * 4, 1)))
+
+    # ---------------- medición ----------------
+    def record(self, endpoint, latency, ok=True, size=0):
+        with self._lock:
+            w = self._window.setdefault(endpoint, {'count': 0, 'errors': 0, 'latency': 0.0, 'bytes': 0})
+            w['count'] += 1
+            w['latency'] += latency
+            w['bytes'] += size
+            if not ok:
+                w['errors'] += 1
+
+    def request(self, endpoint, method, url, **kwargs):
+        """requests.request() cronometrado; 5xx, 429 y timeouts cuentan como error.
+
+        Pasa por el circuit breaker de la familia: con el circuito abierto
+        lanza CircuitOpenError sin salir a la red.
+        """
+        self.breaker.before_call(endpoint)
+        kwargs.setdefault('timeout', self.timeout(endpoint))
+        start = time.monotonic()
+        try:
+            resp = requests.request(method, url, **kwargs)
+        except requests.RequestException:
+            self.record(endpoint, time.monotonic() - start, ok=False)
+            self.breaker.on_failure(endpoint)
+            raise
+        ok = resp.status_code < 500 and resp.status_code != 429
+        self.record(endpoint, time.monotonic() - start, ok=ok, size=len(resp.content or b''))
+        if ok:
+            self.breaker.on_success(endpoint)
+        else:
+            self.breaker.on_failure(endpoint)
+        return resp
+
+    # ---------------- ajuste AIMD ----------------
+    def adjust(self, endpoint, page_size=None):
+        """Reajusta workers/timeout con la ventana medida.
+
+        page_size (el tamaño realmente pedido) solo se pasa tras descargar
+        una página de un endpoint paginado: es entonces cuando se ajusta
+        también el tamaño de página.
+        """
+        with self._lock:
+            w = self._window.pop(endpoint, None)
+        if not w or not w['count']:
+            return
+        self._touched.add(endpoint)
+
+        st = self._endpoint(endpoint)
+        lim = self.limits
+        error_rate = w['errors'] / w['count']
+        avg_latency = w['latency'] / w['count']
+        avg_bytes = w['bytes'] / w['count']
+
+        # Latencia suavizada (EWMA) para calcular el timeout
+        prev = st.get('latency')
+        st['latency'] = round(avg_latency if not prev else 0.7 * prev + 0.3 * avg_latency, 3)
+        st['error_rate'] = round(error_rate, 3)
+        st['avg_kb'] = round(avg_bytes / 1024, 1)
+
+        step = lim['toptex_page_size_step']
+        if error_rate > lim['toptex_error_rate_max'] or avg_latency > lim['toptex_latency_target']:
+            # Decrecimiento multiplicativo
+            st['workers'] = max(lim['toptex_workers_min'], st['workers'] // 2)
+            if page_size and st['page_size']:
+                half = (st['page_size'] // 2) // step * step
+                st['page_size'] = max(lim['toptex_page_size_min'], half)
+            _logger.info(
+                f"🐢 {endpoint}: backoff (errores={error_rate:.0%}, latencia={avg_latency:.1f}s) "
+                f"→ page_size={st['page_size']} workers={st['workers']}"
+            )
+        else:
+            # Incremento aditivo
+            st['workers'] = min(lim['toptex_workers_max'], st['workers'] + 1)
+            if page_size and st['page_size']:
+                grown = st['page_size'] + step
+                per_item = avg_bytes / page_size
+                if grown <= lim['toptex_page_size_max'] and per_item * grown <= lim['toptex_payload_max_kb'] * 1024:
+                    st['page_size'] = grown
+            _logger.info(
+                f"🚀 {endpoint}: ok (errores={error_rate:.0%}, latencia={avg_latency:.1f}s) "
+                f"→ page_size={st['page_size']} workers={st['workers']}"
+            )
+
+    def save(self):
+        for endpoint in list(self._window):
+            self.adjust(endpoint)
+        save_json_params(self.icp.env, {
+            f'{STATE_PARAM}.{endpoint}': self.state[endpoint] for endpoint in self._touched
+        })
+        self.breaker.save()
+
+    # ---------------- ejecución en paralelo ----------------
+    def map(self, endpoint, fn, items, deadline=None, key=None, workers=None):
+        """Ejecuta fn(item) en paralelo (solo HTTP, nunca ORM) por tandas.
+
+        Tras cada tanda se reajusta el nº de workers, así que un proxy que se
+        degrada a mitad de ejecución se nota en la siguiente tanda.
+        Genera pares (item, resultado); resultado es None si fn falla.
+        Los elementos descartados por el circuit breaker no se devuelven: se
+        anotan con key(item) para procesarlos primero en la próxima ejecución;
+        los devueltos salen de esa lista. Los que no se llegan a procesar (tiempo
+        límite, excepción) conservan su estado anterior. El tiempo límite se
+        mira antes de cada elemento: como mucho se pasa en lo que tardan los
+        elementos ya en curso.
+        workers fija el paralelismo (consultas interactivas) en vez del aprendido.
+        """
+        skipped = []
+        items = list(items)
+        pos = 0
+        late = 0
+        while pos < len(items) and not late:
+            n_workers = max(1, workers or self.workers(endpoint))
+            chunk = items[pos:pos + n_workers * 4]
+            pos += len(chunk)
+
+            def _safe(item):
+                if deadline and time.monotonic() > deadline:
+                    return _LATE
+                try:
+                    return fn(item)
+                except CircuitOpenError:
+                    skipped.append(item)
+                    return _SKIPPED
+                except Exception as e:
+                    _logger.warning(f"⚠️ {endpoint}: error procesando {item}: {e}")
+                    return None
+
+            if n_workers == 1:
+                results = [_safe(item) for item in chunk]
+            else:
+                with ThreadPoolExecutor(max_workers=n_workers) as pool:
+                    results = list(pool.map(_safe, chunk))
+            for item, result in zip(chunk, results):
+                if result is _LATE:
+                    late += 1
+                elif result is not _SKIPPED:
+                    if key:
+                        self.breaker.resolve(endpoint, key(item))
+                    yield item, result
+            self.adjust(endpoint)
+
+        if late:
+            _logger.info(f"⏹️ {endpoint}: tiempo límite alcanzado, quedan {late + len(items) - pos} elementos.")
+
+        if skipped:
+            _logger.warning(f"⏭️ {endpoint}: {len(skipped)} elementos saltados por circuito abierto")
+            if key:
+                for item in skipped:
+                    self.breaker.skip(endpoint, key(item))
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+
+from .toptex_params import load_json_param, save_json_params
+
+_logger = logging.getLogger(__name__)
+
+# Una clave por familia: toptex_circuit_state.<familia> / toptex_circuit_skipped.<familia>
+STATE_PARAM = 'toptex_circuit_state'
+SKIPPED_PARAM = 'toptex_circuit_skipped'
+
+# Familias de endpoints con circuito propio
+FAMILIES = ('auth', 'catalog', 'inventory', 'price', 'images')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Llamada descartada sin tocar la red porque el circuito está abierto."""
+
+    def __init__(self, family):
+        super().__init__(f"Circuito '{family}' abierto")
+        self.family = family
+
+
+class TopTexCircuitBreaker:
+    """Circuit breaker por familia de endpoints del proxy TopTex.
+
+    - closed: las llamadas pasan; N fallos/timeouts seguidos lo abren.
+    - open: las llamadas fallan al instante (CircuitOpenError) hasta que
+      pasa el cooldown.
+    - half_open: se deja pasar UNA llamada de prueba; si va bien se cierra,
+      si falla vuelve a abrirse.
+
+    El estado y los elementos saltados se guardan en ir.config_parameter
+    (toptex_circuit_state.<familia> / toptex_circuit_skipped.<familia>) para
+    que la siguiente ejecución empiece por ellos. Un elemento saltado solo
+    sale de la lista cuando se procesa (resolve), no al leerla.
+    """
+
+    def __init__(self, icp):
+        self.icp = icp
+        self.threshold = int(icp.get_param('toptex_cb_failure_threshold') or 5)
+        self.cooldown = float(icp.get_param('toptex_cb_cooldown') or 60)
+
+        # opened_at se guarda en epoch para que sobreviva entre ejecuciones
+        self.state = {}
+        self.skipped = {}
+        for family in FAMILIES:
+            st = load_json_param(icp, f'{STATE_PARAM}.{family}')
+            self.state[family] = {
+                'state': st.get('state', CLOSED),
+                'failures': int(st.get('failures', 0)),
+                'opened_at': float(st.get('opened_at', 0)),
+            }
+            # dict como conjunto ordenado: conserva el orden de llegada
+            items = load_json_param(icp, f'{SKIPPED_PARAM}.{family}').get('items') or []
+            self.skipped[family] = dict.fromkeys(items)
+        self._added = {}
+        self._resolved = {}
+        self._touched = set()
+        self._probing = set()
+        self._lock = threading.Lock()
+
+    def _family(self, family):
+        return self.state.setdefault(family, {'state': CLOSED, 'failures': 0, 'opened_at': 0.0})
+
+    # ---------------- control de llamadas ----------------
+    def before_call(self, family):
+        """Lanza CircuitOpenError si la llamada no debe salir."""
+        with self._lock:
+            st = self._family(family)
+            if st['state'] == CLOSED:
+                return
+            if st['state'] == OPEN:
+                if time.time() - st['opened_at'] < self.cooldown:
+                    raise CircuitOpenError(family)
+                st['state'] = HALF_OPEN
+                self._touched.add(family)
+                _logger.info(f"🟡 Circuito {family}: half-open, enviando sonda")
+            # half-open: solo una sonda a la vez
+            if family in self._probing:
+                raise CircuitOpenError(family)
+            self._probing.add(family)
+
+    def on_success(self, family):
+        with self._lock:
+            st = self._family(family)
+            if st['state'] != CLOSED or st['failures']:
+                self._touched.add(family)
+            if st['state'] != CLOSED:
+                _logger.info(f"🟢 Circuito {family}: cerrado, el proxy responde")
+            st.update(state=CLOSED, failures=0, opened_at=0.0)
+            self._probing.discard(family)
+
+    def on_failure(self, family):
+        with self._lock:
+            st = self._family(family)
+            st['failures'] += 1
+            self._touched.add(family)
+            probe_failed = family in self._probing
+            self._probing.discard(family)
+            if probe_failed or (st['state'] == CLOSED and st['failures'] >= self.threshold):
+                st.update(state=OPEN, opened_at=time.time())
+                _logger.warning(
+                    f"🔴 Circuito {family}: abierto tras {st['failures']} fallos, "
+                    f"reintento en {self.cooldown:.0f}s"
+                )
+
+    def is_open(self, family):
+        return self._family(family)['state'] != CLOSED
+
+    # ---------------- elementos saltados ----------------
+    def skip(self, family, key):
+        with self._lock:
+            self.skipped.setdefault(family, {})[key] = None
+            self._added.setdefault(family, {})[key] = None
+            self._resolved.get(family, set()).discard(key)
+
+    def resolve(self, family, key):
+        """El elemento ya se procesó: sale de la lista de reintentos."""
+        with self._lock:
+            if key in self.skipped.get(family, {}):
+                self.skipped[family].pop(key)
+                self._resolved.setdefault(family, set()).add(key)
+            self._added.get(family, {}).pop(key, None)
+
+    def retry_items(self, family):
+        """Elementos saltados en ejecuciones anteriores, para procesarlos primero."""
+        with self._lock:
+            return list(self.skipped.get(family) or [])
+
+    def save(self):
+        values = {f'{STATE_PARAM}.{family}': self.state[family] for family in self._touched}
+        for family in set(self._added) | set(self._resolved):
+            added = list(self._added.get(family) or [])
+            resolved = self._resolved.get(family) or set()
+            if not added and not resolved:
+                continue
+
+            # Mezcla con lo guardado por otros crons: quita lo resuelto aquí
+            # y añade lo saltado aquí
+            def _merge(current, added=added, resolved=resolved):
+                items = [k for k in current.get('items') or [] if k not in resolved]
+                known = set(items)
+                return {'items': items + [k for k in added if k not in known]}
+            values[f'{SKIPPED_PARAM}.{family}'] = _merge
+        save_json_params(self.icp.env, values)
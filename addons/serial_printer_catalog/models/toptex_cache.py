@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+
+class TTLCache:
+    """Caché clave → valor con caducidad, compartida por los hilos del worker."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, ttl):
+        """Valor si se guardó hace menos de ttl segundos, si no None."""
+        with self._lock:
+            entry = self._data.get(key)
+        if entry and time.monotonic() - entry[0] < ttl:
+            return entry[1]
+        return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+
+# Token de autenticación por (proxy, usuario). El stock no va aquí: su
+# caché compartida entre workers es stock.quant.toptex_checked_at.
+token_cache = TTLCache()
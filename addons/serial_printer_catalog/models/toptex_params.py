@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+
+# -------------------------------------------------
+# Util: guardar estado JSON en ir.config_parameter con cursor propio
+#   Cada clave se relee y se mezcla justo antes de escribir, y el commit va
+#   en una transacción aparte: si otro cron escribió la misma clave, el
+#   conflicto solo pierde este estado, nunca los datos de la sincronización.
+# -------------------------------------------------
+def save_json_params(env, values):
+    """values = {clave: dict | función}.
+
+    Un dict se mezcla sobre lo ya guardado; una función recibe lo guardado
+    y devuelve el valor nuevo (para mezclas que también quitan elementos).
+    """
+    if not values:
+        return
+    try:
+        with env.registry.cursor() as cr:
+            icp = api.Environment(cr, SUPERUSER_ID, {})['ir.config_parameter']
+            for key, value in values.items():
+                try:
+                    current = json.loads(icp.get_param(key) or '{}')
+                except ValueError:
+                    current = {}
+                if callable(value):
+                    current = value(current)
+                else:
+                    current.update(value)
+                icp.set_param(key, json.dumps(current, sort_keys=True))
+    except Exception as e:
+        _logger.warning(f"⚠️ No se pudo guardar el estado TopTex ({', '.join(values)}): {e}")
+
+
+def load_json_param(icp, key):
+    try:
+        return json.loads(icp.get_param(key) or '{}')
+    except ValueError:
+        _logger.warning(f"⚠️ Parámetro {key} corrupto, se ignora.")
+        return {}